@@ -1,10 +1,10 @@
 #! /usr/local/bin/python3
 
 import cv2
+import hashlib
 import itertools
 import numpy as np
 import os
-import random
 import tkinter as tk
 import tkinter.messagebox as mb
 
@@ -20,9 +20,9 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
     Display a sliding puzzle using a square image. Said square image is divided
     into smaller square sub-images, according to the argument provided to the
     constructor. All sub-images are then resized so that the final puzzle is
-    `imsize' wide and `imsize' high. They are then saved to the disk, so that they
-    can be used the next time this program is run. The input image must be square
-    in shape for this to work as expected.
+    `imsize' wide and `imsize' high. They are then saved to the disk in a single
+    file, so that they can be used the next time this program is run. The input
+    image must be square in shape for this to work as expected.
 
     Each sub-image is put on a button, which, when clicked, will move to the empty
     slot if possible. The spacing between the sub-images can be controlled by
@@ -37,13 +37,18 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
         images: list (list of sub-images)
         buttons: list (list of buttons the sub-images are drawn on)
         vacant: tuple (indicates which location is currently vacant)
+        pos: dict (maps each button to its current (row, column) location)
+        grid_map: dict (maps each occupied (row, column) location to its button)
+        home: dict (maps each button to the (row, column) location it belongs to)
+        misplaced: int (how many buttons are not at their home location)
+        neighbours: dict (maps each (row, column) location to the list of locations adjacent to it)
         monitor_status: bool (whether or not to show success message on completion)
         moves: int (how many moves the user has made)
 
     Methods:
         __init__    This is like the constructor in Java or C++
         move:       move the indicated sub-image to the vacant slot if possible
-        randomise:  randomly call `move' a large number of times
+        randomise:  move the vacant slot around randomly a large number of times
     '''
 
     def __init__(self, parent, N = 3, image = 'crysis2.png'):   # N and image are arguments with default values
@@ -52,49 +57,77 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
         self.N = N
         self.images = []
         self.buttons = []
+        self.pos = {}
+        self.grid_map = {}
+        self.home = {}
+        self.misplaced = 0  # the initial configuration is the solved one
         self.vacant = (self.N - 1, self.N - 1)
         self.monitor_status = False
         self.moves = 0
-        self.count_label = tk.Label(self)
 
         parent.title('Sliding Puzzle')
         parent.resizable(False, False)
 
+        # itertools.product() is used to find the cartesian product of two sets
+        # [: -1] all elements except the last one. -1 is the negative indexing, which means the last element
+        # computed once here, since both the cropping loop and the button loop need it
+        coords = list(itertools.product(range(self.N), range(self.N)))[: -1]
+
+        # the locations adjacent to each location never change, so find them once here for randomise()
+        self.neighbours = {(r, c): [(r + dr, c + dc) for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                                    if 0 <= r + dr < self.N and 0 <= c + dc < self.N]
+                           for r, c in itertools.product(range(self.N), range(self.N))}
+
         # check if images are already available
         # if not, create the images and save them for future use
-        try:
-            for i in range(self.N ** 2 - 1):
-                # 'with' statement will automatically release files once its usage is complete
-                # {i:03d} means to add leading 0s to number i, total three digits
-                # f'img{i:03d}.png' is the f-strings syntax in Python
-                with open(f'img{i:03d}.png'):
-                    pass    # same as do nothing
-        except FileNotFoundError:
+        # all sub-images are stored together in a single file, so only one file has to be checked
+        # the name depends on the contents of the image, so that pieces of a different image are never reused
+        with open(image, 'rb') as f:
+            key = hashlib.md5(f.read()).hexdigest()[: 8]
+        cache = f'tiles_{key}_{self.N}.npz'
+        if os.path.exists(cache):
+            # 'with' statement closes the underlying zip file once the sub-images are read
+            with np.load(cache) as data:
+                tiles = data['tiles']
+        else:
             # cv2.imread() return image matrix in the form of numpy.ndarray class
             img = cv2.imread(image)
-            # itertools.product() is used to find the cartesian product of two sets
-            # [: -1] all elements except the last one. -1 is the negative indexing, which means the last element
-            for i, (r, c) in enumerate(list(itertools.product(range(self.N), range(self.N)))[: -1]):
-                h_step = img.shape[0] // self.N     # img.shape[0] is the height of the image
-                v_step = img.shape[1] // self.N     # img.shape[1] is the width of the image
-                # slicing the original image into N x N grid, and resize the cropped piece to fit the window
-                img_crop = img[r * h_step : (r + 1) * h_step, c * v_step : (c + 1) * v_step]
-                img_crop = cv2.resize(img_crop, (imsize // self.N, imsize // self.N))
-                cv2.imwrite(f'img{i:03d}.png', img_crop)
-        finally:
-            for i, (r, c) in enumerate(list(itertools.product(range(self.N), range(self.N)))[: -1]):
-                # use tk.PhotoImage() to get image object
-                self.images.append(tk.PhotoImage(file = f'img{i:03d}.png'))
-                # use tk.Button() to add image on button
-                button = tk.Button(self, image = self.images[i])
-                # button['command'] assigns a command to the 'command' attribute of a button widget
-                # 'Lambda _button = button' This is a lambda function whic is a anonymous function in Python
-                # '_button = button' initializes the local variable _button with the current value of 'button'
-                # 'self.move(_button)' is the function that will be executed when the buttuon is clicked
-                button['command'] = lambda _button = button: self.move(_button)
-                # button.grid() arrange button into specified row and column
-                button.grid(row = r, column = c)
-                self.buttons.append(button)
+            # resize the whole image once so that it fits the window, instead of resizing every piece
+            step = imsize // self.N
+            img = cv2.resize(img, (step * self.N, step * self.N))
+            # slicing the resized image into N x N grid, and stack the pieces into one array
+            tiles = np.stack([img[r * step : (r + 1) * step, c * step : (c + 1) * step] for r, c in coords])
+            # the freshly made pieces are used directly, so the file just written is not read back
+            # write to a temporary file first and then rename it, so that an interrupted write never
+            # leaves behind a broken cache file which would be trusted the next time
+            temp = f'{cache}.{os.getpid()}.tmp'
+            with open(temp, 'wb') as f:
+                np.savez_compressed(f, tiles = tiles)
+            os.replace(temp, cache)
+
+        # tk.PhotoImage() understands the PPM format natively, so build one in memory from each sub-image
+        # OpenCV stores the colours as BGR, whereas PPM expects RGB, so convert all sub-images at once
+        # all sub-images have the same size, so they can share the same PPM header
+        # the PPM data is passed as raw bytes, since Tk only accepts base64-encoded data for GIF and PNG
+        tiles = np.ascontiguousarray(tiles[..., ::-1])
+        header = f'P6 {tiles.shape[2]} {tiles.shape[1]} 255\n'.encode()
+        for i, (r, c) in enumerate(coords):
+            # use tk.PhotoImage() to get image object
+            self.images.append(tk.PhotoImage(data = header + tiles[i].tobytes(), format = 'PPM'))
+            # use tk.Button() to add image on button
+            button = tk.Button(self, image = self.images[i])
+            # button['command'] assigns a command to the 'command' attribute of a button widget
+            # 'Lambda _button = button' This is a lambda function whic is a anonymous function in Python
+            # '_button = button' initializes the local variable _button with the current value of 'button'
+            # 'self.move(_button)' is the function that will be executed when the buttuon is clicked
+            button['command'] = lambda _button = button: self.move(_button)
+            # button.grid() arrange button into specified row and column
+            button.grid(row = r, column = c)
+            self.buttons.append(button)
+            # keep track of the button locations ourselves, so that grid_info() need not be queried
+            self.pos[button] = (r, c)
+            self.grid_map[(r, c)] = button
+            self.home[button] = (r, c)
 
         randomise_button = tk.Button(self, text = 'Start', command = self.randomise)
         #randomise_button.grid(row = self.N, columnspan = self.N, pady = (4 * pad, pad))
@@ -119,9 +152,17 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
 
         vacant_row, vacant_column = self.vacant     # the vacant spot is initialized at (2, 2)
         # get row and column value of clicked button
-        button_row, button_column = tuple(map(_button.grid_info().get, ('row', 'column')))
-        if set((abs(vacant_row - button_row), abs(vacant_column - button_column))) == {0, 1}: # adjacent to each other
+        button_row, button_column = self.pos[_button]
+        if abs(vacant_row - button_row) + abs(vacant_column - button_column) == 1: # adjacent to each other
             _button.grid(row = vacant_row, column = vacant_column)
+            self.pos[_button] = self.vacant
+            self.grid_map[self.vacant] = _button
+            del self.grid_map[(button_row, button_column)]
+            # only the moved button can have left or reached its home location
+            if (button_row, button_column) == self.home[_button]:
+                self.misplaced += 1
+            elif self.vacant == self.home[_button]:
+                self.misplaced -= 1
             self.vacant = (button_row, button_column)
 
         # increment counter only if the game is being monitored
@@ -132,9 +173,7 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
             self.count_label.configure(text = count_text)
 
             # upon completion, stop monitoring
-            # The expression inside all() is called python generator expression used to generate interable object
-            # which is passed as parameter into function all()
-            if all(i == button.grid_info().get('row') * self.N + button.grid_info().get('column') for i, button in enumerate(self.buttons)):
+            if self.misplaced == 0:
                 self.monitor_status = False
                 mb.showinfo(title = 'Puzzle Solved!', message = f'You have solved the puzzle in {self.moves} moves!')
 
@@ -148,8 +187,12 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
         # start monitoring the game only after this function is called
         # i.e. after the user clicks the button to randomise the sub-images
         self.monitor_status = False
-        for button in random.choices(self.buttons, k = 1000 * self.N):
-            self.move(button)
+        # move the vacant slot to a random neighbouring location each time, so that every move is a valid one
+        # all the random numbers are generated in one go by NumPy
+        # 12 is divisible by 2, 3 and 4, so d % len(neighbours) picks every neighbour with equal probability
+        for d in np.random.default_rng().integers(0, 12, size = 100 * self.N):
+            neighbours = self.neighbours[self.vacant]
+            self.move(self.grid_map[neighbours[d % len(neighbours)]])
         self.monitor_status = True
         self.moves = 0
         self.count_label.configure(text = "moves: 0")
@@ -158,12 +201,16 @@ class puzzle(tk.Frame): # class puzzle inherit from tk.Frame
         """
         Reset the puzzle to its initial configuration.
         """
+        self.grid_map.clear()
         for i, button in enumerate(self.buttons):
-            #row, column = divmod(i, self.N)
-            row = i // self.N
-            column = i % self.N
-            button.grid(row=row, column=column)
+            row, column = divmod(i, self.N)
+            # buttons which are already in place need not be arranged again
+            if self.pos[button] != (row, column):
+                button.grid(row=row, column=column)
+                self.pos[button] = (row, column)
+            self.grid_map[(row, column)] = button
         self.vacant = (self.N - 1, self.N - 1)
+        self.misplaced = 0
         self.monitor_status = False
         self.moves = 0
         self.count_label.configure(text = "moves: 0")